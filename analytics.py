@@ -0,0 +1,219 @@
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Columnar store of finished calls for campaign analytics
+class CallAnalytics:
+    TERMINAL_STATUSES = ('completed', 'no-answer', 'busy', 'failed', 'canceled')
+    ANSWERED_BY_VALUES = ('human', 'machine_start', 'machine_end_beep', 'machine_end_silence',
+                          'machine_end_other', 'fax', 'unknown')
+    MAX_CAMPAIGNS = 1000
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._size = 0
+        self._columns = self._allocate(self.INITIAL_CAPACITY)
+        # Categorical columns are stored as small integer codes; outcome and answered_by
+        # use fixed vocabularies, campaigns are registered up to MAX_CAMPAIGNS
+        self._vocab = {
+            "outcome": list(self.TERMINAL_STATUSES),
+            "answered_by": list(self.ANSWERED_BY_VALUES),
+            "campaign": ["default"]
+        }
+        self._codes = {name: {value: i for i, value in enumerate(values)} for name, values in self._vocab.items()}
+        self._duration_sum = 0.0
+        self._duration_count = 0
+
+    @staticmethod
+    def _allocate(capacity):
+        return {
+            "started_at": np.zeros(capacity, dtype=np.float64),
+            "duration": np.full(capacity, np.nan, dtype=np.float32),
+            "turns": np.zeros(capacity, dtype=np.uint16),
+            "outcome": np.zeros(capacity, dtype=np.uint8),
+            "answered_by": np.zeros(capacity, dtype=np.uint8),
+            "campaign": np.zeros(capacity, dtype=np.uint16),
+            # 1-based turn at which an appointment was first suggested, 0 if never
+            "appointment_turn": np.zeros(capacity, dtype=np.uint16)
+        }
+
+    def _encode_campaign(self, campaign):
+        codes = self._codes["campaign"]
+        if campaign not in codes:
+            if len(codes) >= self.MAX_CAMPAIGNS:
+                raise ValueError(f"Campaign limit of {self.MAX_CAMPAIGNS} reached")
+            codes[campaign] = len(self._vocab["campaign"])
+            self._vocab["campaign"].append(campaign)
+        return codes[campaign]
+
+    def register_campaign(self, campaign):
+        with self._lock:
+            self._encode_campaign(campaign)
+
+    def record(self, started_at, duration, turns, outcome, answered_by, campaign, appointment_turn=None):
+        if outcome not in self._codes["outcome"]:
+            raise ValueError(f"Unsupported call outcome '{outcome}'")
+        if answered_by not in self._codes["answered_by"]:
+            answered_by = 'unknown'
+        if duration is not None and not np.isfinite(duration):
+            duration = None
+
+        with self._lock:
+            campaign_code = self._encode_campaign(campaign or "default")
+            if self._size == len(self._columns["started_at"]):
+                grown = self._allocate(self._size * 2)
+                for name, column in self._columns.items():
+                    grown[name][:self._size] = column
+                self._columns = grown
+
+            i = self._size
+            self._columns["started_at"][i] = started_at
+            self._columns["duration"][i] = np.nan if duration is None else duration
+            self._columns["turns"][i] = min(turns, np.iinfo(np.uint16).max)
+            self._columns["appointment_turn"][i] = min(appointment_turn or 0, np.iinfo(np.uint16).max)
+            self._columns["outcome"][i] = self._codes["outcome"][outcome]
+            self._columns["answered_by"][i] = self._codes["answered_by"][answered_by]
+            self._columns["campaign"][i] = campaign_code
+            self._size += 1
+
+            if outcome == 'completed' and duration is not None:
+                self._duration_sum += duration
+                self._duration_count += 1
+
+    def average_duration(self):
+        return self._duration_sum / self._duration_count if self._duration_count else 0
+
+    def __len__(self):
+        return self._size
+
+    def snapshot(self):
+        # Rows are only ever appended and growth swaps in new arrays, so views up to
+        # the current size stay valid after the lock is released
+        with self._lock:
+            n = self._size
+            columns = {name: column[:n] for name, column in self._columns.items()}
+            vocab = {name: list(values) for name, values in self._vocab.items()}
+        return columns, vocab
+
+    def report(self, group_by=None, since=None, until=None, percentiles=(50, 90, 99)):
+        columns, vocab = self.snapshot()
+
+        mask = np.ones(len(columns["started_at"]), dtype=bool)
+        if since is not None:
+            mask &= columns["started_at"] >= since
+        if until is not None:
+            mask &= columns["started_at"] < until
+        if not mask.all():
+            columns = {name: column[mask] for name, column in columns.items()}
+
+        keys, labels = self._group_keys(group_by, columns, vocab)
+        n_groups = len(labels)
+
+        calls = np.bincount(keys, minlength=n_groups)
+        completed = columns["outcome"] == vocab["outcome"].index('completed')
+        human = self._code_mask(columns["answered_by"], vocab["answered_by"], lambda v: v == 'human')
+        machine = self._code_mask(columns["answered_by"], vocab["answered_by"], lambda v: v.startswith('machine'))
+        appointment = columns["appointment_turn"] > 0
+        has_duration = completed & ~np.isnan(columns["duration"])
+
+        completed_count = np.bincount(keys, weights=completed, minlength=n_groups)
+        human_count = np.bincount(keys, weights=human, minlength=n_groups)
+        machine_count = np.bincount(keys, weights=machine, minlength=n_groups)
+        appointment_count = np.bincount(keys, weights=appointment, minlength=n_groups)
+        duration_count = np.bincount(keys[has_duration], minlength=n_groups)
+        duration_sum = np.bincount(keys[has_duration], weights=columns["duration"][has_duration], minlength=n_groups)
+        turns_sum = np.bincount(keys[completed], weights=columns["turns"][completed], minlength=n_groups)
+        appointment_turns_sum = np.bincount(
+            keys[appointment], weights=columns["appointment_turn"][appointment], minlength=n_groups)
+        duration_percentiles = self._grouped_percentiles(
+            keys[has_duration], columns["duration"][has_duration], n_groups, percentiles)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            amd_rate = machine_count / (human_count + machine_count)
+            conversion_rate = appointment_count / calls
+            avg_duration = duration_sum / duration_count
+            avg_turns = turns_sum / completed_count
+            avg_turns_to_appointment = appointment_turns_sum / appointment_count
+
+        groups = []
+        for g in np.flatnonzero(calls):
+            groups.append({
+                "group": labels[g],
+                "calls": int(calls[g]),
+                "completed": int(completed_count[g]),
+                "human": int(human_count[g]),
+                "machine": int(machine_count[g]),
+                "appointments": int(appointment_count[g]),
+                "amd_rate": _json_float(amd_rate[g]),
+                "conversion_rate": _json_float(conversion_rate[g]),
+                "avg_duration": _json_float(avg_duration[g]),
+                "duration_percentiles": {
+                    f"p{p:g}": _json_float(value) for p, value in zip(percentiles, duration_percentiles[g])
+                },
+                "avg_turns": _json_float(avg_turns[g]),
+                "avg_turns_to_appointment": _json_float(avg_turns_to_appointment[g])
+            })
+        return {
+            "group_by": group_by,
+            "total_calls": int(calls.sum()),
+            "groups": groups
+        }
+
+    @staticmethod
+    def _code_mask(codes, values, predicate):
+        # Lookup table indexed by code is much cheaper than np.isin on millions of rows
+        table = np.array([predicate(value) for value in values] + [False], dtype=bool)
+        return table[codes]
+
+    @staticmethod
+    def _group_keys(group_by, columns, vocab):
+        n = len(columns["started_at"])
+        if group_by is None:
+            return np.zeros(n, dtype=np.int64), ["all"]
+        if group_by == 'hour':
+            hours = columns["started_at"].astype(np.int64) // 3600 % 24
+            return hours, [f"{h:02d}:00Z" for h in range(24)]
+        if group_by == 'day':
+            days = columns["started_at"].astype(np.int64) // 86400
+            first_day = int(days.min()) if n else 0
+            last_day = int(days.max()) if n else 0
+            labels = [
+                datetime.fromtimestamp(day * 86400, timezone.utc).date().isoformat()
+                for day in range(first_day, last_day + 1)
+            ]
+            return days - first_day, labels
+        if group_by in ('campaign', 'answered_by', 'outcome'):
+            return columns[group_by].astype(np.int64), vocab[group_by]
+        raise ValueError(f"Unsupported group_by '{group_by}'")
+
+    @staticmethod
+    def _grouped_percentiles(keys, values, n_groups, percentiles):
+        # Sort once by (group, value), then index every group's percentiles with linear interpolation.
+        # Offsetting each group by the value span turns the two-key sort into a single np.sort,
+        # which is an order of magnitude faster than lexsort/argsort on millions of rows.
+        result = np.full((n_groups, len(percentiles)), np.nan)
+        if values.size == 0:
+            return result
+        values = values.astype(np.float64)
+        low = values.min()
+        span = values.max() - low + 1
+        counts = np.bincount(keys, minlength=n_groups)
+        sorted_values = np.sort(keys * span + (values - low))
+        sorted_values -= np.repeat(np.arange(n_groups) * span, counts) - low
+        starts = np.cumsum(counts) - counts
+        present = counts > 0
+
+        positions = (counts[present, None] - 1) * (np.asarray(percentiles, dtype=np.float64) / 100.0)
+        lower = np.floor(positions).astype(np.int64)
+        upper = np.ceil(positions).astype(np.int64)
+        base = starts[present, None]
+        lower_values = sorted_values[base + lower]
+        upper_values = sorted_values[base + upper]
+        result[present] = lower_values + (upper_values - lower_values) * (positions - lower)
+        return result
+
+def _json_float(value):
+    value = float(value)
+    return None if np.isnan(value) else round(value, 4)
@@ -2,7 +2,7 @@ import os
 import re
 import json
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from flask import Flask, request, jsonify, render_template, send_from_directory
 from twilio.twiml.voice_response import VoiceResponse, Gather
 from twilio.rest import Client
@@ -12,6 +12,8 @@ import sys
 from dotenv import load_dotenv
 from openai import OpenAI # Import the OpenAI library
 import requests
+import numpy as np
+from analytics import CallAnalytics
 
 load_dotenv()
 
@@ -34,6 +36,7 @@ TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN')
 TWILIO_PHONE_NUMBER = os.environ.get('TWILIO_PHONE_NUMBER')
 CALENDLY_LINK = "https://calendly.com/kanchan-g12/let-s-connect-30-minute-exploratory-call"
 WEBSITE_URL = "www.ikanchan.com"
+MAX_CAMPAIGN_NAME_LENGTH = 64
 
 logger.info("Starting Sam Appointment Application")
 logger.info(f"Twilio Phone Number: {TWILIO_PHONE_NUMBER}")
@@ -86,6 +89,12 @@ performance_metrics = {
     "total_request_time": []
 }
 
+# Per-call state collected while a call is in progress (campaign, turns, turn of first appointment suggestion)
+active_calls = {}
+
+# Columnar store of finished calls for campaign analytics
+call_analytics = CallAnalytics()
+
 def send_sms(to, body):
     message = client.messages.create(
         body="Thank you for the call. You can book an appointment here https://calendly.com/kanchan-g12/let-s-connect-30-minute-exploratory-call",
@@ -192,13 +201,26 @@ def make_call():
         logger.error("No phone number provided for call")
         return jsonify({"error": "No phone number provided"}), 400
     
+    campaign = request.json.get('campaign', 'default')
+    if not isinstance(campaign, str) or not campaign.strip() or len(campaign) > MAX_CAMPAIGN_NAME_LENGTH:
+        logger.error("Invalid campaign provided for call")
+        return jsonify({"error": f"Campaign must be a non-empty string of at most {MAX_CAMPAIGN_NAME_LENGTH} characters"}), 400
+    
+    try:
+        call_analytics.register_campaign(campaign)
+    except ValueError as e:
+        logger.error(f"Rejected campaign '{campaign}': {e}")
+        return jsonify({"error": str(e)}), 400
+    
     try:
         # Construct the full URL for the TwiML endpoint
         host = request.host_url.rstrip('/')
         twiml_url = f"{host}/twiml"
         status_callback_url = f"{host}/call-status"
+        amd_callback_url = f"{host}/amd-status"
         logger.info(f"TwiML URL for call: {twiml_url}")
         logger.info(f"Status callback URL: {status_callback_url}")
+        logger.info(f"AMD callback URL: {amd_callback_url}")
         
         # Update call statistics
         call_statistics["total_calls"] += 1
@@ -209,6 +231,8 @@ def make_call():
             url=twiml_url,
             machine_detection='Enable',
             async_amd=True,
+            async_amd_status_callback=amd_callback_url,
+            async_amd_status_callback_method='POST',
             status_callback=status_callback_url,
             status_callback_event=['initiated', 'ringing', 'answered', 'completed'],
             timeout=30  # Add a 30-second timeout to avoid long waits
@@ -216,6 +240,11 @@ def make_call():
     
         logger.info(f"Call initiated successfully. SID: {call.sid}")
         conversation_history[call.sid] = []
+        active_calls[call.sid] = {
+            "started_at": time.time(),
+            "campaign": campaign,
+            "turns": 0
+        }
         
         total_time = time.time() * 1000 - request_start_time
         track_performance("total_request_time", total_time)
@@ -235,6 +264,31 @@ def call_status():
     
     logger.info(f"Call status update: SID={call_sid}, Status={call_status}, Duration={call_duration}s, AnsweredBy={answered_by}")
     
+    # With async AMD the result arrives on /amd-status; the status callback value is only a fallback
+    call_info = active_calls.get(call_sid, {})
+    answered_by = call_info.get("answered_by") or answered_by
+    
+    # Record the call's final outcome for analytics
+    if call_status in CallAnalytics.TERMINAL_STATUSES:
+        active_calls.pop(call_sid, None)
+        duration_float = None
+        if call_duration:
+            try:
+                duration_float = float(call_duration)
+            except (ValueError, TypeError):
+                logger.warning(f"Could not convert call duration '{call_duration}' to float")
+        
+        call_analytics.record(
+            started_at=call_info.get("started_at", time.time() - (duration_float or 0)),
+            duration=duration_float,
+            turns=call_info.get("turns", 0),
+            outcome=call_status,
+            answered_by=answered_by,
+            campaign=call_info.get("campaign"),
+            appointment_turn=call_info.get("appointment_turn")
+        )
+        call_statistics["avg_call_duration"] = call_analytics.average_duration()
+    
     # Handle different call statuses for analytics
     if call_status == 'completed':
         sms_sid = send_sms(phone_number, body)
@@ -246,17 +300,6 @@ def call_status():
         elif answered_by in ['machine_start', 'machine']:
             call_statistics["answering_machines"] += 1
         
-        # Update average call duration if we have data
-        if call_duration and call_statistics["successful_calls"] > 0:
-            try:
-                duration_float = float(call_duration)
-                call_statistics["avg_call_duration"] = (
-                    (call_statistics["avg_call_duration"] * (call_statistics["successful_calls"] - 1) +
-                    duration_float) / call_statistics["successful_calls"]
-                )
-            except (ValueError, TypeError):
-                logger.warning(f"Could not convert call duration '{call_duration}' to float")
-        
         # Archive conversation history
         if call_sid in conversation_history:
             conversation_history[f"{call_sid}_completed"] = {
@@ -271,6 +314,18 @@ def call_status():
     
     return '', 204
 
+@app.route('/amd-status', methods=['POST'])
+def amd_status():
+    call_sid = request.values.get('CallSid')
+    answered_by = request.values.get('AnsweredBy')
+    
+    logger.info(f"AMD result received: SID={call_sid}, AnsweredBy={answered_by}")
+    
+    if call_sid in active_calls:
+        active_calls[call_sid]["answered_by"] = answered_by
+    
+    return '', 204
+
 @app.route('/twiml', methods=['GET', 'POST'])
 def twiml_response():
     call_sid = request.form.get('CallSid')
@@ -380,6 +435,11 @@ def handle_conversation():
         logger.info("Getting AI response for phone conversation")
         ai_response = get_ai_response(input_text, call_sid)
         
+        if call_sid in active_calls:
+            active_calls[call_sid]["turns"] += 1
+            if ai_response["suggested_appointment"]:
+                active_calls[call_sid].setdefault("appointment_turn", active_calls[call_sid]["turns"])
+        
         # SMS handling for appointments
         if ai_response["suggested_appointment"] and call_sid:
             try:
@@ -582,6 +642,11 @@ def cleanup_sessions():
                     if now - completed_at > 24 * 60 * 60 * 1000:  # 24 hours
                         del conversation_history[call_id]
             
+            # Drop in-progress call state that never received a final status callback
+            for call_id, call_info in list(active_calls.items()):
+                if now - call_info["started_at"] * 1000 > 24 * 60 * 60 * 1000:  # 24 hours
+                    del active_calls[call_id]
+            
             if removed_count > 0:
                 logger.info(f"Removed {removed_count} inactive web sessions")
                 
@@ -655,6 +720,57 @@ def statistics():
         }
     })
 
+# Campaign analytics report over recorded call outcomes
+@app.route('/stats/report', methods=['GET'])
+def statistics_report():
+    if request.args.get('key') != os.environ.get('STATS_API_KEY'):
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    request_start_time = time.time() * 1000
+    
+    try:
+        since = parse_report_time(request.args.get('since'))
+        until = parse_report_time(request.args.get('until'))
+        percentiles = tuple(float(p) for p in request.args.get('percentiles', '50,90,99').split(','))
+        if not all(0 <= p <= 100 for p in percentiles):
+            raise ValueError("Percentiles must be between 0 and 100")
+        report = call_analytics.report(
+            group_by=request.args.get('group_by') or None,
+            since=since,
+            until=until,
+            percentiles=percentiles
+        )
+    except ValueError as e:
+        logger.warning(f"Invalid stats report request: {e}")
+        return jsonify({"error": str(e)}), 400
+    
+    total_time = time.time() * 1000 - request_start_time
+    track_performance("stats_report", total_time)
+    logger.info(f"Stats report over {report['total_calls']} calls generated in {total_time:.2f}ms")
+    
+    report["timestamp"] = datetime.now().isoformat()
+    report["query_time_ms"] = round(total_time, 2)
+    return jsonify(report)
+
+def parse_report_time(value):
+    # Accept either epoch seconds or an ISO 8601 timestamp; naive timestamps are UTC,
+    # matching the UTC hour and day buckets of the report
+    if not value:
+        return None
+    try:
+        timestamp = float(value)
+    except ValueError:
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f"Invalid time '{value}', expected epoch seconds or ISO 8601")
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        timestamp = parsed.timestamp()
+    if not np.isfinite(timestamp):
+        raise ValueError(f"Invalid time '{value}', must be finite")
+    return timestamp
+
 if __name__ == '__main__':
     # Using environment variable PORT or default to 8000
     port = int(os.environ.get('PORT', 8000))
@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+
+from analytics import CallAnalytics
+
+START = 1_700_000_000.0
+PERCENTILES = (0, 25, 50, 90, 99, 100)
+
+
+def build_store(n_calls=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    store = CallAnalytics()
+    campaigns = ["spring", "summer", "autumn"]
+    for campaign in campaigns:
+        store.register_campaign(campaign)
+
+    for i in range(n_calls):
+        turns = int(rng.integers(0, 12))
+        store.record(
+            started_at=START + float(rng.integers(0, 3 * 86400)),
+            duration=float(rng.integers(1, 600)) if rng.random() < 0.9 else None,
+            turns=turns,
+            outcome=CallAnalytics.TERMINAL_STATUSES[i % len(CallAnalytics.TERMINAL_STATUSES)],
+            answered_by=CallAnalytics.ANSWERED_BY_VALUES[i % len(CallAnalytics.ANSWERED_BY_VALUES)],
+            campaign=campaigns[i % len(campaigns)],
+            appointment_turn=int(rng.integers(1, turns + 1)) if turns and rng.random() < 0.2 else None
+        )
+    return store
+
+
+def group_keys(group_by, columns, vocab):
+    if group_by == 'hour':
+        return columns["started_at"].astype(np.int64) // 3600 % 24, [f"{h:02d}:00Z" for h in range(24)]
+    if group_by == 'day':
+        days = columns["started_at"].astype(np.int64) // 86400
+        return days - days.min(), None
+    return columns[group_by].astype(np.int64), vocab[group_by]
+
+
+@pytest.mark.parametrize("group_by", ['hour', 'day', 'campaign', 'answered_by', 'outcome'])
+def test_duration_percentiles_match_numpy(group_by):
+    store = build_store()
+    report = store.report(group_by=group_by, percentiles=PERCENTILES)
+    columns, vocab = store.snapshot()
+    keys, labels = group_keys(group_by, columns, vocab)
+    completed = columns["outcome"] == vocab["outcome"].index('completed')
+    has_duration = completed & ~np.isnan(columns["duration"])
+
+    present = np.flatnonzero(np.bincount(keys))
+    assert len(report["groups"]) == len(present)
+    for group, key in zip(report["groups"], present):
+        if labels is not None:
+            assert group["group"] == labels[key]
+        durations = columns["duration"][has_duration & (keys == key)].astype(np.float64)
+        expected = np.percentile(durations, PERCENTILES) if durations.size else [None] * len(PERCENTILES)
+        actual = [group["duration_percentiles"][f"p{p:g}"] for p in PERCENTILES]
+        assert actual == pytest.approx(expected, abs=1e-4)
+
+
+def test_report_totals():
+    store = build_store()
+    report = store.report(group_by='campaign')
+    columns, _ = store.snapshot()
+    appointment = columns["appointment_turn"] > 0
+
+    assert report["total_calls"] == len(store)
+    assert sum(group["calls"] for group in report["groups"]) == len(store)
+    assert sum(group["appointments"] for group in report["groups"]) == int(appointment.sum())
+
+    overall = store.report()["groups"][0]
+    assert overall["avg_turns_to_appointment"] == pytest.approx(
+        columns["appointment_turn"][appointment].mean(), abs=1e-4)
+
+
+def test_empty_store():
+    report = CallAnalytics().report(group_by='day')
+    assert report["total_calls"] == 0
+    assert report["groups"] == []
+
+    for group_by in (None, 'hour', 'campaign', 'answered_by', 'outcome'):
+        assert CallAnalytics().report(group_by=group_by)["groups"] == []
+
+
+def test_since_until_filter():
+    store = build_store()
+    since = START + 86400
+    until = START + 2 * 86400
+    report = store.report(group_by='hour', since=since, until=until, percentiles=PERCENTILES)
+    columns, _ = store.snapshot()
+    in_range = (columns["started_at"] >= since) & (columns["started_at"] < until)
+    assert report["total_calls"] == int(in_range.sum())
+
+    completed = columns["outcome"] == 0
+    durations = columns["duration"][in_range & completed]
+    durations = durations[~np.isnan(durations)].astype(np.float64)
+    overall = store.report(since=since, until=until, percentiles=PERCENTILES)["groups"][0]
+    assert [overall["duration_percentiles"][f"p{p:g}"] for p in PERCENTILES] == pytest.approx(
+        np.percentile(durations, PERCENTILES), abs=1e-4)
+
+    assert store.report(since=START + 10 * 86400)["groups"] == []
+
+
+def test_bounded_categories():
+    store = CallAnalytics()
+    for i in range(300):
+        store.record(START, 10.0, 1, 'completed', f"bogus_{i}", None)
+    groups = store.report(group_by='answered_by')["groups"]
+    assert [(group["group"], group["calls"]) for group in groups] == [('unknown', 300)]
+
+    for i in range(CallAnalytics.MAX_CAMPAIGNS - 1):
+        store.register_campaign(f"campaign_{i}")
+    with pytest.raises(ValueError):
+        store.register_campaign("one_too_many")